@@ -1,21 +1,24 @@
 import os
-import re
+from collections import defaultdict
 from datetime import datetime, timedelta
+from functools import lru_cache
 from multiprocessing import Pool
 
 import netCDF4 as nc
 import numpy as np
 import shapely.geometry
-from pykml import parser
-from scipy.spatial import KDTree
+import shapely.prepared
+from lxml import etree
 
-# Set multiprocessing params
-ncore = "1"
-os.environ["OMP_NUM_THREADS"] = ncore
-os.environ["OPENBLAS_NUM_THREADS"] = ncore
-os.environ["MKL_NUM_THREADS"] = ncore
-os.environ["VECLIB_MAXIMUM_THREADS"] = ncore
-os.environ["NUMEXPR_NUM_THREADS"] = ncore
+# KML tags and paths of EnMAP metadata
+KML_NAMESPACE = "{http://www.opengis.net/kml/2.2}"
+PLACEMARK_TAG = KML_NAMESPACE + "Placemark"
+NAME_TAG = KML_NAMESPACE + "name"
+DATE_PATH = f"{KML_NAMESPACE}ExtendedData/{KML_NAMESPACE}Data[@name='date']/{KML_NAMESPACE}value"
+TIME_PATH = f"{KML_NAMESPACE}ExtendedData/{KML_NAMESPACE}Data[@name='time']/{KML_NAMESPACE}value"
+CLOUDS_PATH = f"{KML_NAMESPACE}ExtendedData/{KML_NAMESPACE}Data[@name='clouds']/{KML_NAMESPACE}value"
+COORDINATES_PATH = f"{KML_NAMESPACE}Polygon/{KML_NAMESPACE}outerBoundaryIs/" \
+                   f"{KML_NAMESPACE}LinearRing/{KML_NAMESPACE}coordinates"
 
 
 def parse_enmap(file):
@@ -24,43 +27,39 @@ def parse_enmap(file):
     :param file: KML file (non-operational product)
     :return: list of dictionary objects (one for each tile)
     """
-    # Load KML
-    with open(file, "r") as f:
-        doc = parser.parse(f)
-    # Get KML root
-    root = doc.getroot()
-    namespace = "{http://www.opengis.net/kml/2.2}"
-    enmap_files = []
-    # Extract all name, date+time, and extent
-    for pm in root.iter(namespace + "Placemark"):
-        name = pm.find(namespace + "name").text
-        clouds = pm.find(namespace + "ExtendedData") \
-            .find(namespace + "Data[@name='clouds']") \
-            .find(namespace + "value").text
-        date = pm.find(namespace + "ExtendedData") \
-            .find(namespace + "Data[@name='date']") \
-            .find(namespace + "value").text
-        time = pm.find(namespace + "ExtendedData") \
-            .find(namespace + "Data[@name='time']") \
-            .find(namespace + "value").text
-        # Combine date and time
-        dt_format = "%Y-%m-%d %H:%M:%S.%f"
+    placemarks = []
+    # Stream placemarks from KML instead of loading the whole document
+    for event, pm in etree.iterparse(file, events=("end",), tag=PLACEMARK_TAG):
+        date = pm.findtext(DATE_PATH)
+        time = pm.findtext(TIME_PATH)
+        # Combine date and time (ms precision)
         time_str = time[:time.index(".") + 4]
-        dt_string = f"{date} {time_str}"
-        time_dt = datetime.strptime(dt_string, dt_format)
-        # Filter year, month, and day
-        if (target_year is None or time_dt.year == target_year) and \
-                (target_month is None or time_dt.month == target_month) and \
-                (target_day is None or time_dt.day == target_day):
-            filtered_time = time_dt
-        else:
-            continue
-        # Get spatial footprint
-        polygon = pm.find(namespace + "Polygon")
-        coordinates_str = polygon.find(namespace + "outerBoundaryIs") \
-            .find(namespace + "LinearRing") \
-            .find(namespace + "coordinates").text
-        # Split and clean the coordinates string
+        placemarks.append((
+            pm.findtext(NAME_TAG),
+            f"{date}T{time_str}",
+            pm.findtext(CLOUDS_PATH),
+            pm.findtext(COORDINATES_PATH)
+        ))
+        # Free processed placemark
+        pm.clear(keep_tail=True)
+        pm.getparent().remove(pm)
+    # Parse all date+time strings at once
+    times = np.array([placemark[1] for placemark in placemarks], dtype="datetime64[ms]")
+    years = times.astype("datetime64[Y]").astype(int) + 1970
+    months = times.astype("datetime64[M]").astype(int) % 12 + 1
+    days = (times.astype("datetime64[D]") - times.astype("datetime64[M]")).astype(int) + 1
+    # Filter year, month, and day
+    mask = np.ones(len(placemarks), dtype=bool)
+    if target_year is not None:
+        mask &= years == target_year
+    if target_month is not None:
+        mask &= months == target_month
+    if target_day is not None:
+        mask &= days == target_day
+    enmap_files = []
+    for index in np.flatnonzero(mask):
+        name, _, clouds, coordinates_str = placemarks[index]
+        # Split and clean the coordinates string of the spatial footprint
         extent = []
         for point_str in coordinates_str.strip().split(" "):
             lon, lat, alt = point_str.split(",")
@@ -69,7 +68,7 @@ def parse_enmap(file):
         file_data = {
             "filename": name,
             "extent": extent,
-            "center_time": filtered_time,
+            "center_time": times[index].item(),
             "clouds": clouds
         }
         enmap_files.append(file_data)
@@ -80,19 +79,17 @@ def get_tropomi_extent(file):
     """
     Extract image extent from TROPOMI NetCDF file
     :param file: TROPOMI NetCDF file
-    :return: image extent
+    :return: image extent as (N, 2) array of lon lat coordinates
     """
     # Open NetCDF file
-    dataset = nc.Dataset(file, "r")
-    # Extract spatial footprint
-    coords_str = dataset["METADATA/EOP_METADATA/om:featureOfInterest/eop:multiExtentOf/gml:surfaceMembers/gml:exterior"]
-    coords_str = coords_str.__dict__
-    coords_str = coords_str["gml:posList"]
-    coords = re.findall(r"(-?\d+\.\d+)\s(-?\d+\.\d+)", coords_str)
-    # Create list of coordinate tuples with lon lat order
-    coords_list = [(float(coord[1]), float(coord[0])) for coord in coords]
-    dataset.close()
-    return coords_list
+    with nc.Dataset(file, "r") as dataset:
+        # Extract spatial footprint
+        coords_str = dataset["METADATA/EOP_METADATA/om:featureOfInterest/eop:multiExtentOf/gml:surfaceMembers/gml:exterior"]
+        coords_str = coords_str.__dict__
+        coords_str = coords_str["gml:posList"]
+    # Parse lat lon pairs and swap to lon lat order
+    coords = np.fromstring(coords_str, sep=" ").reshape(-1, 2)[:, ::-1]
+    return coords
 
 
 def get_tropomi_filename_date(file):
@@ -109,6 +106,57 @@ def get_tropomi_filename_date(file):
     return date_obj
 
 
+def get_tropomi_filename_times(file):
+    """
+    Extract acquisition start and end time from the TROPOMI filename
+    :param file: TROPOMI filename
+    :return: start and end time as datetime objects
+    """
+    file = os.path.basename(file)
+    # Extract start and end portions from the filename (yyyymmddThhmmss)
+    start_time = datetime.strptime(file[20:35], "%Y%m%dT%H%M%S")
+    end_time = datetime.strptime(file[36:51], "%Y%m%dT%H%M%S")
+    return start_time, end_time
+
+
+def get_time_diff_lower_bound(time, tropomi_file):
+    """
+    Get lower bound of the time difference to any scanline of a TROPOMI acquisition
+    :param time: datetime object
+    :param tropomi_file: TROPOMI candidate file
+    :return: lower bound as timedelta (zero if time lies within the acquisition)
+    """
+    if time < tropomi_file["start_time"]:
+        return tropomi_file["start_time"] - time
+    if time > tropomi_file["end_time"]:
+        return time - tropomi_file["end_time"]
+    return timedelta(0)
+
+
+@lru_cache(maxsize=4)
+def load_tropomi_grid(file):
+    """
+    Load TROPOMI pixel grid and scanline times once per NetCDF file
+    :param file: TROPOMI NetCDF file
+    :return: dictionary containing grid shape, flattened latitude and longitude, delta time, and reference time
+    """
+    # Read all required variables with a single open (no handle is kept in the cache)
+    with nc.Dataset(file, "r") as dataset:
+        # Read plain arrays instead of masked arrays
+        dataset.set_auto_mask(False)
+        latitude = dataset["/PRODUCT/latitude"][0]
+        longitude = dataset["/PRODUCT/longitude"][0]
+        delta_time = dataset["/PRODUCT/delta_time"][0]
+        file_time = int(dataset["/PRODUCT/time"][0])
+    return {
+        "shape": latitude.shape,
+        "latitude": np.asarray(latitude, dtype=np.float32).ravel(),
+        "longitude": np.asarray(longitude, dtype=np.float32).ravel(),
+        "delta_time": delta_time,
+        "reference_time": datetime(2010, 1, 1, 0, 0, 0) + timedelta(seconds=file_time)
+    }
+
+
 def get_tropomi_datetime(file, overlap):
     """
     Extract central acquisition time of overlapping part of TROPOMI NetCDF file
@@ -116,91 +164,104 @@ def get_tropomi_datetime(file, overlap):
     :param file: TROPOMI NetCDF file
     :return: central acquisition time as datetime object
     """
-    tropomi_scanlines = []
+    grid = load_tropomi_grid(file)
+    tropomi_scanlines = get_tropomi_scanlines(grid, get_overlap_corners(overlap))
+    min_tropomi_scanline = tropomi_scanlines.min()
+    max_tropomi_scanline = tropomi_scanlines.max()
+    min_tropomi_time = get_tropomi_scanline_time(grid, min_tropomi_scanline)
+    max_tropomi_time = get_tropomi_scanline_time(grid, max_tropomi_scanline)
     # Get central time (ms)
-    for coordinates in overlap:
-        tropomi_scanlines.append(get_tropomi_scanline(file, coordinates))
-    min_tropomi_scanline = min(tropomi_scanlines)
-    max_tropomi_scanline = max(tropomi_scanlines)
-    min_tropomi_time = get_tropomi_scanline_time(file, min_tropomi_scanline)
-    max_tropomi_time = get_tropomi_scanline_time(file, max_tropomi_scanline)
     center_tropomi_time_ms = round((min_tropomi_time + max_tropomi_time) / 2)
     center_tropomi_time = timedelta(milliseconds=center_tropomi_time_ms)
     # Transform central time to UTC
-    dataset = nc.Dataset(file, "r")
-    file_time = dataset["/PRODUCT/time"]
-    time_delta = timedelta(seconds=int(file_time[0]))
-    reference_time = datetime(2010, 1, 1, 0, 0, 0)
-    datetime_date = reference_time + time_delta + center_tropomi_time
-    dataset.close()
-    return datetime_date
+    return grid["reference_time"] + center_tropomi_time
 
 
-def get_tropomi_scanline_time(file, scanline):
+def get_overlap_corners(overlap):
     """
-    Get TROPOMI delta time value at a specific scanline
-    :param file: TROPOMI NetCDF
-    :param scanline: scanline index
-    :return: time at scanline (in ms)
+    Reduce overlap polygon to at most four coordinates bounding its scanline range
+    :param overlap: coordinates of the overlap polygon (closed ring)
+    :return: list of lon lat coordinates
     """
-    dataset = nc.Dataset(file, "r")
-    delta_time_var = dataset["/PRODUCT/delta_time"]
-    # Extract delta time scanline
-    delta_time_at_scanline = delta_time_var[0, scanline]
-    dataset.close()
-    return delta_time_at_scanline
+    # Drop closing coordinate of the ring
+    coordinates = list(overlap)[:-1]
+    if len(coordinates) <= 4:
+        return coordinates
+    # Use bounding box corners for more complex overlaps
+    min_lon, min_lat = np.min(coordinates, axis=0)
+    max_lon, max_lat = np.max(coordinates, axis=0)
+    return [(min_lon, min_lat), (min_lon, max_lat), (max_lon, min_lat), (max_lon, max_lat)]
 
 
-def get_tropomi_scanline(file, coordinate):
+def get_tropomi_scanline_time(grid, scanline):
     """
-    Extract closest TROPOMI scanline (and ground pixel) at a specific coordinate
-    :param file: TROPOMI NetCDF
-    :param coordinate: EPSG:4326 coordinate
-    :return: closest scanline
+    Get TROPOMI delta time value at a specific scanline
+    :param grid: TROPOMI pixel grid (see load_tropomi_grid)
+    :param scanline: scanline index
+    :return: time at scanline (in ms)
     """
-    target_latitude = coordinate[1]
-    target_longitude = coordinate[0]
-    # Load NetCDF
-    dataset = nc.Dataset(file, "r")
-    latitude = dataset["/PRODUCT/latitude"][0]
-    longitude = dataset["/PRODUCT/longitude"][0]
-    # Build KDTree
-    coords = np.dstack([latitude.ravel(), longitude.ravel()])[0]
-    tree = KDTree(coords)
-    # Find nearest ground pixel
-    distance, index = tree.query([target_latitude, target_longitude])
-    # Extract scanline and ground pixel
-    scanline, ground_pixel = np.unravel_index(index, latitude.shape)
-    dataset.close()
-    return scanline
+    return grid["delta_time"][scanline]
 
 
-def check_intersect(extent_1, extent_2):
+def get_tropomi_scanlines(grid, coordinates):
     """
-    Check if two polygons intersect (used to check intersection with AOI and between EnMAP and TROPOMI acquisitions)
-    :param extent_1: spatial extent of first polygon
-    :param extent_2: spatial extent of second polygon
-    :return: True (polygons intersect) or False (polygons don't intersect)
+    Extract closest TROPOMI scanlines (and ground pixels) at a list of coordinates
+    :param grid: TROPOMI pixel grid (see load_tropomi_grid)
+    :param coordinates: EPSG:4326 coordinates
+    :return: closest scanline for each coordinate
     """
-    polygon_1 = shapely.Polygon(extent_1)
-    polygon_2 = shapely.Polygon(extent_2)
-    return polygon_1.intersects(polygon_2)
-
-
-def get_intersect(extent_1, extent_2):
+    targets = np.array([(lat, lon) for (lon, lat) in coordinates], dtype=np.float32)
+    indices = np.empty(len(targets), dtype=np.intp)
+    # Reuse float32 buffers for squared distances instead of allocating temporaries per coordinate
+    distances = np.empty_like(grid["latitude"])
+    longitude_distances = np.empty_like(grid["longitude"])
+    # Find nearest ground pixel of each coordinate with a single pass over the grid
+    for i, (target_latitude, target_longitude) in enumerate(targets):
+        np.subtract(grid["latitude"], target_latitude, out=distances)
+        np.square(distances, out=distances)
+        np.subtract(grid["longitude"], target_longitude, out=longitude_distances)
+        np.square(longitude_distances, out=longitude_distances)
+        distances += longitude_distances
+        indices[i] = distances.argmin()
+    # Extract scanlines and ground pixels
+    scanlines, ground_pixels = np.unravel_index(indices, grid["shape"])
+    return scanlines
+
+
+def get_intersect(polygon_1, polygon_2):
     """
     Calculate the intersection of two polygons and return the coordinates of the intersection polygon
-    :param extent_1: spatial extent of first polygon
-    :param extent_2: spatial extent of second polygon
+    :param polygon_1: first polygon
+    :param polygon_2: second polygon
     :return: coordinates of the intersection polygon
     """
-    polygon_1 = shapely.Polygon(extent_1)
-    polygon_2 = shapely.Polygon(extent_2)
     intersection_polygon = polygon_2.intersection(polygon_1)
     intersection_coords = intersection_polygon.exterior.coords
     return intersection_coords
 
 
+def get_intersects(polygon, polygons):
+    """
+    Calculate the intersections of one polygon with an array of polygons in a single call
+    :param polygon: polygon to intersect with
+    :param polygons: array of polygons
+    :return: list of intersection polygon coordinates (None where the intersection failed)
+    """
+    try:
+        intersection_polygons = shapely.intersection(polygons, polygon)
+    except shapely.errors.GEOSException:
+        # Fall back to pairwise intersections to skip only the failing polygons
+        intersection_coords = []
+        for other_polygon in polygons:
+            try:
+                intersection_coords.append(get_intersect(polygon, other_polygon))
+            except shapely.errors.GEOSException as e:
+                print(f"Intersection Error: {e}")
+                intersection_coords.append(None)
+        return intersection_coords
+    return [intersection_polygon.exterior.coords for intersection_polygon in intersection_polygons]
+
+
 def get_candidates_enmap(metadata_file_list):
     """
     Loop through acquisitions (KML metadata files) and add acquisitions intersecting with AOI to a list
@@ -210,73 +271,98 @@ def get_candidates_enmap(metadata_file_list):
     candidate_files = []
     # Loop through acquisitions
     for file in metadata_file_list:
-        image_extent = file["extent"]
+        polygon = shapely.Polygon(file["extent"])
         # Check if acquisition intersects with AOI and add to list if it does
-        if check_intersect(image_extent, area_of_interest):
+        if prepared_area_of_interest.intersects(polygon):
+            file["polygon"] = polygon
             candidate_files.append(file)
     return candidate_files
 
 
-def get_candidates_tropomi(file_list):
+def init_candidate_worker(aoi):
     """
-    Loop through TROPOMI acquisitions and add acquisitions intersecting with AOI to a list
-    :param file_list: list of acquisitions
-    :return: list of AOI intersecting acquisitions as dictionaries
+    Prepare AOI polygon in a pool worker (independent of the process start method)
+    :param aoi: spatial extent of the area of interest
     """
-    candidate_files = []
-    # Loop through acquisitions
-    for file in file_list:
-        image_extent = get_tropomi_extent(file)
-        # Check if acquisition intersects with AOI and add to list if it does
-        if check_intersect(image_extent, area_of_interest):
-            filename_date = get_tropomi_filename_date(file)
-            file_data = {
-                "filename": file,
-                "extent": image_extent,
-                "filename_date": filename_date
-            }
-            candidate_files.append(file_data)
-    return candidate_files
+    global prepared_area_of_interest
+    prepared_area_of_interest = shapely.prepared.prep(shapely.Polygon(aoi))
 
 
-def check_dates(date1, date2):
+def process_tropomi_file(file):
     """
-    Check if two dates are the same (same year, month, and day)
-    :param date1: First date
-    :param date2: Second date
-    :return: True if the dates are the same, False otherwise
+    Check if TROPOMI acquisition intersects with AOI
+    :param file: TROPOMI NetCDF file
+    :return: AOI intersecting acquisition as dictionary (None if it does not intersect)
     """
-    return date1.year == date2.year and date1.month == date2.month and date1.day == date2.day
+    image_extent = get_tropomi_extent(file)
+    polygon = shapely.Polygon(image_extent)
+    if not prepared_area_of_interest.intersects(polygon):
+        return None
+    filename_date = get_tropomi_filename_date(file)
+    start_time, end_time = get_tropomi_filename_times(file)
+    return {
+        "filename": file,
+        "extent": image_extent,
+        "polygon": polygon,
+        "filename_date": filename_date,
+        "start_time": start_time,
+        "end_time": end_time
+    }
 
 
-def process_enmap_file(enmap_file, tropomi_candidate_files):
+def get_candidates_tropomi(file_list):
+    """
+    Check TROPOMI acquisitions against AOI in parallel and add intersecting acquisitions to a list
+    :param file_list: list of acquisitions
+    :return: list of AOI intersecting acquisitions as dictionaries
     """
-    Iterate over TROPOMI candidate files and return EnMAP file with closest TROPOMI
+    # Create process pool with AOI passed to each worker once (reading footprints is I/O bound)
+    with Pool(initializer=init_candidate_worker, initargs=(area_of_interest,)) as pool:
+        results = list(pool.imap(process_tropomi_file, file_list, chunksize=8))
+    # Filter AOI intersecting acquisitions
+    return [result for result in results if result is not None]
+
+
+def process_enmap_file(enmap_file, tropomi_by_day):
+    """
+    Iterate over same-day TROPOMI candidate files and return EnMAP file with closest TROPOMI
     :param enmap_file: EnMAP candidate file
-    :param tropomi_candidate_files: List of TROPOMI candidate files
+    :param tropomi_by_day: TROPOMI candidate files grouped by (year, month, day)
     :return: EnMAP file with closest TROPOMI
     """
     closest_tropomi = None
     min_time_diff = timedelta.max
     overlap = None
-    for tropomi_file in tropomi_candidate_files:
-        if check_dates(enmap_file["center_time"], tropomi_file["filename_date"]):
-            if check_intersect(enmap_file["extent"], tropomi_file["extent"]):
-                try:
-                    overlap = get_intersect(enmap_file["extent"], tropomi_file["extent"])
-                except shapely.errors.GEOSException as e:
-                    print(f"Intersection Error: {e}")
-                    continue
-                try:
-                    tropomi_file["center_time"] = get_tropomi_datetime(tropomi_file["filename"], overlap)
-                    time_diff = abs(enmap_file["center_time"] - tropomi_file["center_time"])
-                except ValueError as e:
-                    print(f"Value Error: {e}")
-                    continue
-                if time_diff < min_time_diff:
-                    min_time_diff = time_diff
-                    closest_tropomi = tropomi_file
-                    print(f"{enmap_file["filename"]} offset: {time_diff}")
+    enmap_time = enmap_file["center_time"]
+    tropomi_files = tropomi_by_day.get((enmap_time.year, enmap_time.month, enmap_time.day))
+    if not tropomi_files:
+        return None
+    # Only visit TROPOMI acquisitions intersecting with the EnMAP tile
+    tropomi_polygons = np.array([tropomi_file["polygon"] for tropomi_file in tropomi_files])
+    intersecting = shapely.intersects(tropomi_polygons, enmap_file["polygon"])
+    tropomi_files = [tropomi_file for tropomi_file, mask in zip(tropomi_files, intersecting) if mask]
+    # Intersect with all remaining TROPOMI footprints at once
+    overlaps = get_intersects(enmap_file["polygon"], tropomi_polygons[intersecting])
+    # Visit TROPOMI acquisitions in order of the smallest time difference possible for them
+    candidates = sorted(((get_time_diff_lower_bound(enmap_time, tropomi_file), tropomi_file, tropomi_overlap)
+                         for tropomi_file, tropomi_overlap in zip(tropomi_files, overlaps)
+                         if tropomi_overlap is not None), key=lambda candidate: candidate[0])
+    for lower_bound, tropomi_file, tropomi_overlap in candidates:
+        # Remaining acquisitions cannot be closer than the closest one found so far
+        if lower_bound >= min_time_diff:
+            break
+        try:
+            tropomi_time = get_tropomi_datetime(tropomi_file["filename"], tropomi_overlap)
+            time_diff = abs(enmap_time - tropomi_time)
+        except ValueError as e:
+            print(f"Value Error: {e}")
+            continue
+        if time_diff < min_time_diff:
+            min_time_diff = time_diff
+            overlap = tropomi_overlap
+            # Copy as TROPOMI files are shared between EnMAP files processed by the same worker
+            closest_tropomi = {**tropomi_file, "center_time": tropomi_time}
+            print(f"{enmap_file["filename"]} offset: {time_diff}")
     return {
         "overlap": overlap,
         "enmap": enmap_file,
@@ -285,6 +371,24 @@ def process_enmap_file(enmap_file, tropomi_candidate_files):
     } if closest_tropomi else None
 
 
+def init_worker(tropomi_files_by_day):
+    """
+    Share TROPOMI candidate files with a pool worker once instead of sending them with every task
+    :param tropomi_files_by_day: TROPOMI candidate files grouped by (year, month, day)
+    """
+    global worker_tropomi_by_day
+    worker_tropomi_by_day = tropomi_files_by_day
+
+
+def process_enmap_batch(enmap_files):
+    """
+    Process same-day EnMAP candidate files against the TROPOMI candidate files shared with the worker
+    :param enmap_files: (index, EnMAP candidate file) tuples of a single day
+    :return: list of (index, EnMAP file with closest TROPOMI) tuples
+    """
+    return [(index, process_enmap_file(enmap_file, worker_tropomi_by_day)) for index, enmap_file in enmap_files]
+
+
 def get_closest_pairs(enmap_candidate_files, tropomi_candidate_files):
     """
     Get closest pairs of TROPOMI and EnMAP acquisitions using multiprocessing
@@ -292,12 +396,43 @@ def get_closest_pairs(enmap_candidate_files, tropomi_candidate_files):
     :param tropomi_candidate_files: TROPOMI candidate files
     :return: list of closest pairs (dictionaries)
     """
-    # Create process pool
-    with Pool() as pool:
-        results = pool.starmap(process_enmap_file,
-                               [(enmap_file, tropomi_candidate_files) for enmap_file in enmap_candidate_files])
-    # Filter valid results
-    return [result for result in results if result is not None]
+    # Group TROPOMI acquisitions by day
+    tropomi_by_day = defaultdict(list)
+    for tropomi_file in tropomi_candidate_files:
+        filename_date = tropomi_file["filename_date"]
+        tropomi_by_day[(filename_date.year, filename_date.month, filename_date.day)].append(tropomi_file)
+    # Group EnMAP acquisitions by day so each worker loads the grids of a day's TROPOMI files once
+    # (keep input index to restore the order of EnMAP acquisitions afterwards)
+    enmap_by_day = defaultdict(list)
+    for index, enmap_file in enumerate(enmap_candidate_files):
+        center_time = enmap_file["center_time"]
+        enmap_by_day[(center_time.year, center_time.month, center_time.day)].append((index, enmap_file))
+    # Split days into several batches if there are fewer days than cores
+    batches_per_day = max(1, os.cpu_count() // max(1, len(enmap_by_day)))
+    batches = [enmap_files[i::batches_per_day] for enmap_files in enmap_by_day.values()
+               for i in range(batches_per_day) if enmap_files[i::batches_per_day]]
+    # Create process pool with TROPOMI candidates passed to each worker once
+    with Pool(initializer=init_worker, initargs=(tropomi_by_day,)) as pool:
+        results = [result for batch_results in pool.imap(process_enmap_batch, batches)
+                   for result in batch_results]
+    # Restore order of EnMAP acquisitions and filter valid results
+    results.sort(key=lambda result: result[0])
+    return [result for index, result in results if result is not None]
+
+
+def format_pair(pair):
+    """
+    Format closest collocated case as a text block
+    :param pair: dictionary containing overlapping acquisitions (dictionary objects) and the time offset
+    :return: text block
+    """
+    overlap_coords = list(pair["overlap"])
+    return (f"Overlap: {overlap_coords}\n"
+            f"EnMAP File: Filename {pair["enmap"]["filename"]}, Datetime: {pair["enmap"]["center_time"]}\n"
+            f"TROPOMI File: Filename {os.path.basename(pair["tropomi"]["filename"]).split(".")[0]}, Datetime: {pair["tropomi"]["center_time"]}\n"
+            f"Cloud Fraction (EnMAP): {pair["enmap"]["clouds"]}\n"
+            f"Time Difference: {pair["time_difference"]}\n"
+            "--------------------\n")
 
 
 def export_pairs(pairs):
@@ -313,16 +448,9 @@ def export_pairs(pairs):
     if target_day:
         output_filename += f"_{target_day}"
     output_filename += ".txt"
-    # Export collocated cases
+    # Export collocated cases with a single write
     with open(output_filename, "w") as output_file:
-        for pair in pairs:
-            overlap_coords = list(pair["overlap"])
-            output_file.write(f"Overlap: {overlap_coords}\n")
-            output_file.write(f"EnMAP File: Filename {pair["enmap"]["filename"]}, Datetime: {pair["enmap"]["center_time"]}\n")
-            output_file.write(f"TROPOMI File: Filename {os.path.basename(pair["tropomi"]["filename"]).split(".")[0]}, Datetime: {pair["tropomi"]["center_time"]}\n")
-            output_file.write(f"Cloud Fraction (EnMAP): {pair["enmap"]["clouds"]}\n")
-            output_file.write(f"Time Difference: {pair["time_difference"]}\n")
-            output_file.write("--------------------\n")
+        output_file.write("".join(format_pair(pair) for pair in pairs))
 
     print(f"collocated cases exported as {output_filename}")
 
@@ -331,6 +459,7 @@ if __name__ == "__main__":
     # Set AOI
     area_of_interest = [(-27, 72), (-27, 34),
                         (43, 34), (43, 72)]  # Europe (top left, bottom left, bottom right, top right)
+    prepared_area_of_interest = shapely.prepared.prep(shapely.Polygon(area_of_interest))
 
     # Define time of interest
     target_year = 2024
@@ -5,6 +5,16 @@ import geopandas as gpd
 from pykml import parser
 from shapely.geometry import Polygon
 
+# Patterns of closest pairs text blocks
+TIMEDIFF_PATTERN = re.compile(r"Time Difference: (.+)")
+FILENAME_PATTERN = re.compile(r"EnMAP File: Filename (.+?), Datetime:")
+
+# KML tags and paths of EnMAP metadata
+KML_NAMESPACE = '{http://www.opengis.net/kml/2.2}'
+PLACEMARK_PATH = f'.//{KML_NAMESPACE}Placemark'
+NAME_TAG = f'{KML_NAMESPACE}name'
+COORDINATES_PATH = f'{KML_NAMESPACE}Polygon/{KML_NAMESPACE}outerBoundaryIs/{KML_NAMESPACE}LinearRing/{KML_NAMESPACE}coordinates'
+
 
 def parse_enmap_data(block):
     """
@@ -12,10 +22,8 @@ def parse_enmap_data(block):
     :param block: closest pairs text block
     :return: dictionary containing extracted file id and time difference in minutes
     """
-    timediff_pattern = r"Time Difference: (.+)"
-    filename_pattern = r"EnMAP File: Filename (.+?), Datetime:"
-    filename_match = re.search(filename_pattern, block)
-    timediff_match = re.search(timediff_pattern, block)
+    filename_match = FILENAME_PATTERN.search(block)
+    timediff_match = TIMEDIFF_PATTERN.search(block)
     # Extract name (datatake id + tile number) and temporal offset from text block
     if filename_match and timediff_match:
         filename = filename_match.group(1)
@@ -47,14 +55,13 @@ def process_file(file):
     return results
 
 
-def extract_coordinates(placemark, namespace):
+def extract_coordinates(placemark):
     """
     Extract coordinates from KML placemark
     :param placemark: KML placemark
-    :param namespace: XML namespace
     :return: list of coordinates as (longitude, latitude) tuples
     """
-    coordinates_text = placemark.find(f'{namespace}Polygon/{namespace}outerBoundaryIs/{namespace}LinearRing/{namespace}coordinates').text
+    coordinates_text = placemark.findtext(COORDINATES_PATH)
     coordinates_list = []
     for coord in coordinates_text.strip().split():
         lon, lat, _ = map(float, coord.split(','))
@@ -71,23 +78,24 @@ def parse_enmap(file, time_differences):
     """
     with open(file, 'r') as f:
         doc = parser.parse(f).getroot()
-    namespace = '{http://www.opengis.net/kml/2.2}'
+    # Index time differences by filename
+    time_diff_by_name = {td['filename']: td['time_diff'] for td in time_differences}
     cases = []
     # Check for matching filenames
-    for placemark in doc.findall(f'.//{namespace}Placemark'):
-        name_data = placemark.find(f'{namespace}name').text
-        if name_data:
-            filename = name_data
-            matching_diff = next((td for td in time_differences if td['filename'] == filename), None)
-            if matching_diff:
-                coordinates = extract_coordinates(placemark, namespace)
-                polygon = Polygon(coordinates)
-                case = {
-                    "filename": filename,
-                    "time_diff": matching_diff['time_diff'],
-                    "geometry": polygon
-                }
-                cases.append(case)
+    for placemark in doc.iterfind(PLACEMARK_PATH):
+        filename = placemark.findtext(NAME_TAG)
+        time_diff = time_diff_by_name.get(filename)
+        if time_diff is None:
+            continue
+        # Only extract coordinates of matching placemarks
+        coordinates = extract_coordinates(placemark)
+        polygon = Polygon(coordinates)
+        case = {
+            "filename": filename,
+            "time_diff": time_diff,
+            "geometry": polygon
+        }
+        cases.append(case)
     return cases
 
 
@@ -98,7 +106,8 @@ def save_to_geopackage(cases, geopackage_path):
     :param geopackage_path: path to the output GeoPackage file
     """
     gdf = gpd.GeoDataFrame(cases)
-    gdf.to_file(geopackage_path, layer='tile_data', driver='GPKG')
+    # Write all features in one vectorized call through pyogrio
+    gdf.to_file(geopackage_path, layer='tile_data', driver='GPKG', engine='pyogrio')
 
 
 if __name__ == "__main__":